@@ -1,12 +1,20 @@
+import os
+from functools import lru_cache
 from pathlib import Path
 
 
+@lru_cache(maxsize=None)
+def _resolve_path(path, cwd) -> Path:
+    # Relative paths depend on the working directory, hence it is part of the cache key
+    return (Path(cwd) / path).resolve()
+
+
 class Consts:
     _DATA = None
 
     @property
     def DATA(self):
         if self._DATA:
-            return Path(self._DATA).resolve()
+            return _resolve_path(self._DATA, os.getcwd())
         else:
             raise ValueError("Use `sensor_position_dataset_helper.set_data_folder()` to specify the data location.")
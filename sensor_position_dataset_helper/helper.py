@@ -1,25 +1,46 @@
 """A set of helpers to load the dataset."""
 
 import json
+import os
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, Dict, Any, Union, List
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Union, List, Tuple, Mapping
 
 import c3d
 import git
 import numpy as np
 import pandas as pd
+from joblib import Memory
 from nilspodlib import SyncedSession
 from scipy.spatial.transform import Rotation
 from typing_extensions import Literal
 
-from sensor_position_dataset_helper.consts import Consts
-from sensor_position_dataset_helper.internal_helpers import (
-    rotation_from_angle,
+from sensor_position_dataset_helper.consts import Consts, _resolve_path
+
+# `rotation_from_angle` is not used here, but is part of the public API via `from helper import *` in `__init__`
+from sensor_position_dataset_helper.internal_helpers import (  # noqa: F401
     rotate_dataset,
+    rotation_from_angle,
     COORDINATE_TRANSFORMATION_DICT,
+    _cached_df_call,
 )
 
 
+def _build_alignment_rotations() -> Dict[str, Rotation]:
+    rotations = {}
+    for key, transformations in COORDINATE_TRANSFORMATION_DICT.items():
+        pos = key.split("_")[1]
+        for foot in ["left", "right"]:
+            rotations["{}_{}".format(foot[0], pos)] = Rotation.from_matrix(transformations["{}_sensor".format(foot)])
+    return rotations
+
+
+#: The rotations to align each foot sensor with the expected foot-sensor-frame.
+#: The transformations are static, so we create the rotation objects only once on import.
+_ALIGNMENT_ROTATIONS = _build_alignment_rotations()
+
+
 def _get_repo_state(repo, version="HEAD"):
     return repo.git.rev_parse(version)
 
@@ -74,30 +95,75 @@ def get_data_folder(data_folder=None, data_subfolder=True):
     return Path(data_folder)
 
 
-def get_all_subjects(include_wrong_recording: bool = False, data_folder=None):
-    """Iterate over all subject ids.
+def _get_resolved_data_folder(data_folder=None, data_subfolder=True) -> Path:
+    # The in-process caches are keyed on the folder.
+    # Relative folders depend on the working directory, hence they are resolved before they are used as key.
+    return _resolve_path(get_data_folder(data_folder, data_subfolder=data_subfolder), os.getcwd())
 
-    If `include_wrong_recording` the first recording of 6dbe is included.
-    This recording is missing one of the sensors and should therefore not be used in most cases.
+
+def clear_caches():
+    """Clear all in-process caches of the files read from the dataset.
+
+    The list of subjects and tests, the metadata, the manual labels and the sensor files are only read once per
+    folder and cached for the lifetime of the process.
+    Unlike the disk cache of `get_session_df`, these caches do not follow the git revision of the dataset.
+    Call this function after checking out a different revision of the dataset or after modifying its files.
     """
-    data_folders = sorted(get_data_folder(data_folder).glob("[!.]*"), key=lambda x: x.name)
-    if len(data_folders) == 0 or not all(len(f.name) in (4, 6) for f in data_folders):
+    _list_subject_folders.cache_clear()
+    _list_tests.cache_clear()
+    _get_test_borders.cache_clear()
+    _load_metadata.cache_clear()
+    _load_manual_labels.cache_clear()
+    _index_sensor_files.cache_clear()
+
+
+@lru_cache(maxsize=None)
+def _list_subject_folders(data_folder: Path) -> Tuple[str, ...]:
+    # The validation happens inside the cached function, so that invalid listings are not cached (`lru_cache` does
+    # not store exceptions) and the folder is scanned again on the next call.
+    subjects = tuple(sorted(f.name for f in data_folder.glob("[!.]*")))
+    if len(subjects) == 0 or not all(len(s) in (4, 6) for s in subjects):
         raise ValueError(
             "The selected folder does not seem to be correct! "
             "No data could be found. "
             f'The selected folder is: "{data_folder}"'
         )
-    for subject in data_folders:
-        if subject.name == "6dbe" and not include_wrong_recording:
+    return subjects
+
+
+@lru_cache(maxsize=None)
+def _list_tests(subject_id: str, data_folder: Path) -> Tuple[str, ...]:
+    return tuple(get_metadata_subject(subject_id, data_folder=data_folder)["mocap_test_start"].keys())
+
+
+@lru_cache(maxsize=None)
+def _get_test_borders(subject_id: str, data_folder: Path) -> Dict[str, Tuple[pd.Timestamp, pd.Timestamp]]:
+    imu_tests = get_metadata_subject(subject_id, data_folder=data_folder)["imu_tests"]
+    return {k: (pd.Timestamp(v["start"], tz="UTC"), pd.Timestamp(v["stop"], tz="UTC")) for k, v in imu_tests.items()}
+
+
+def get_all_subjects(include_wrong_recording: bool = False, data_folder=None):
+    """Iterate over all subject ids.
+
+    If `include_wrong_recording` the first recording of 6dbe is included.
+    This recording is missing one of the sensors and should therefore not be used in most cases.
+
+    The content of the data folder is only scanned once per folder and cached for the lifetime of the process (see
+    `clear_caches`).
+    Folders that do not contain valid data are not cached.
+    """
+    for subject in _list_subject_folders(_get_resolved_data_folder(data_folder)):
+        if subject == "6dbe" and not include_wrong_recording:
             continue
-        yield subject.name
+        yield subject
 
 
 def get_all_tests(subject_id: str, data_folder=None):
-    """Iterate over all tests of a subject."""
-    tests = get_metadata_subject(subject_id, data_folder=data_folder)["mocap_test_start"].keys()
-    for k in tests:
-        yield k
+    """Iterate over all tests of a subject.
+
+    The tests are only read once per subject and cached for the lifetime of the process (see `clear_caches`).
+    """
+    yield from _list_tests(subject_id, _get_resolved_data_folder(data_folder, data_subfolder=False))
 
 
 def get_subject_folder(subject_id: str, data_folder=None) -> Path:
@@ -123,7 +189,35 @@ def get_mocap_events(subject_id, test, data_folder=None) -> pd.DataFrame:
     return pd.read_csv(get_subject_mocap_folder(subject_id, data_folder=data_folder) / (test + "_steps.csv"))
 
 
-def get_session_df(subject_id: str, data_folder=None) -> pd.DataFrame:
+def _rotate_sensor_180_z(df: pd.DataFrame, sensor: str) -> pd.DataFrame:
+    # A rotation by 180 deg around the z-axis only inverts the x and y axis.
+    # This is exact and much cheaper than a general rotation, which would need to copy the full dataframe.
+    # Note, that this modifies `df` in place.
+    positions = df.columns.get_indexer([(sensor, c) for c in ["acc_x", "acc_y", "gyr_x", "gyr_y"]])
+    if (positions < 0).any():
+        raise KeyError("The dataset has no gyr and acc columns for the sensor {}".format(sensor))
+    df.iloc[:, positions] *= -1
+    return df
+
+
+def _get_dataset_revision(data_folder: Path) -> Optional[str]:
+    try:
+        return _get_repo_state(git.Repo(data_folder))
+    except (git.InvalidGitRepositoryError, git.NoSuchPathError, git.GitCommandNotFound, git.GitCommandError):
+        # A missing git executable or a repo without any commit should not prevent loading the data
+        return None
+
+
+def _get_dataset_cache_key(data_folder=None) -> Dict[str, Optional[str]]:
+    # The key arguments for all cached functions that load data from the dataset.
+    # The folder is resolved, so that the key does not depend on how the folder was specified and can be used in
+    # parallel workers, which do not know about the folder configured with `set_data_folder`.
+    # The dataset revision invalidates the cache, when a different version of the dataset is checked out.
+    data_folder = _get_resolved_data_folder(data_folder, data_subfolder=False)
+    return {"data_folder": str(data_folder), "dataset_revision": _get_dataset_revision(data_folder)}
+
+
+def get_session_df(subject_id: str, data_folder=None, memory: Optional[Memory] = None) -> pd.DataFrame:
     """Get and prepare the data of all sensors of a subject.
 
     This methods does multiple things:
@@ -133,7 +227,28 @@ def get_session_df(subject_id: str, data_folder=None) -> pd.DataFrame:
     - sync all IMU files correctly
     - Fix known issues as far as possible
 
+    Parameters
+    ----------
+    subject_id
+        The subject id
+    data_folder
+        The dataset folder. If None, the folder configured with `set_data_folder` is used.
+    memory
+        An optional joblib memory.
+        If provided, the output is cached in the storage location of the memory and reused in subsequent calls.
+        The cache is keyed on the subject, the data folder and, if the data folder is a git repo, the checked out
+        revision of the dataset.
+        Uncommitted changes to the dataset are not detected.
+        Use `memory.clear()` in this case.
+
     """
+    if memory is not None and memory.location is not None:
+        return _cached_df_call(memory, _get_session_df, subject_id, **_get_dataset_cache_key(data_folder))
+    return _get_session_df(subject_id, data_folder)
+
+
+def _get_session_df(subject_id: str, data_folder=None, dataset_revision: Optional[str] = None) -> pd.DataFrame:
+    # `dataset_revision` is not used, but only part of the cache key
     session = SyncedSession.from_folder_path(
         get_subject_imu_folder(subject_id, data_folder=data_folder), legacy_support="resolve"
     )
@@ -150,16 +265,18 @@ def get_session_df(subject_id: str, data_folder=None) -> pd.DataFrame:
     df = session.data_as_df(concat_df=True, index="utc_datetime")
     df.columns = pd.MultiIndex.from_tuples([(sensor_map[s], a) for s, a in df.columns])
     trigger = df["sync"]["analog_2"]
-    df = df.sort_index(axis=1).drop("sync", axis=1)
+    # Select all sensor columns in sorted order in a single step, instead of sorting and dropping "sync" afterwards.
+    # Both would create a full copy of the data.
+    columns = list(df.columns)
+    order = sorted((i for i, c in enumerate(columns) if c[0] != "sync"), key=columns.__getitem__)
+    df = df.take(order, axis=1)
 
     # Some sensors were wrongly attached, this will be fixed here:
     if subject_id in ["8d60", "cb3d", "cdfc"]:
-        rotation = rotation_from_angle(np.deg2rad(180), np.array([0, 0, 1]))
-        df = rotate_dataset(df, {"l_cavity": rotation})
+        df = _rotate_sensor_180_z(df, "l_cavity")
 
     if subject_id in ["4d91", "5237", "80b8", "c9bb"]:
-        rotation = rotation_from_angle(np.deg2rad(180), np.array([0, 0, 1]))
-        df = rotate_dataset(df, {"l_medial": rotation})
+        df = _rotate_sensor_180_z(df, "l_medial")
 
     df[("sync", "trigger")] = trigger
     return df
@@ -191,21 +308,34 @@ def get_imu_test(
     """
     if session_df is None:
         session_df = get_session_df(subject, data_folder=data_folder)
-    meta_data = get_metadata_subject(subject, data_folder=data_folder)
-    test_start = pd.Timestamp(
-        np.datetime64(meta_data["imu_tests"][test_name]["start"]) - np.timedelta64(padding_s, "s")
-    ).tz_localize("UTC")
-    test_stop = pd.Timestamp(
-        np.datetime64(meta_data["imu_tests"][test_name]["stop"]) + np.timedelta64(padding_s, "s")
-    ).tz_localize("UTC")
-    test = session_df.loc[test_start:test_stop]
+    start, stop = _get_test_borders(subject, _get_resolved_data_folder(data_folder, data_subfolder=False))[test_name]
+    padding = pd.Timedelta(seconds=padding_s)
+    test_start = start - padding
+    test_stop = stop + padding
+    # The session index is sorted, so we can find the (inclusive) borders by binary search and slice by position.
+    # This is equivalent to `session_df.loc[test_start:test_stop]`, but skips the label based indexing machinery.
+    index = session_df.index
+    test = session_df.iloc[index.searchsorted(test_start, side="left") : index.searchsorted(test_stop, side="right")]
     return test
 
 
+@lru_cache(maxsize=None)
+def _load_manual_labels(labels_file: Path) -> pd.DataFrame:
+    return pd.read_csv(labels_file, header=0)
+
+
+def _get_manual_labels(subject_id: str, data_folder=None) -> pd.DataFrame:
+    # Returns the cached dataframe. It must not be modified in place.
+    folder = get_subject_folder(subject_id, data_folder=_get_resolved_data_folder(data_folder, data_subfolder=False))
+    return _load_manual_labels(folder / "manual_stride_border.csv")
+
+
 def get_manual_labels(subject_id: str, data_folder=None) -> pd.DataFrame:
-    """Get the manual stride border labels for a subject."""
-    labels = get_subject_folder(subject_id, data_folder=data_folder) / "manual_stride_border.csv"
-    return pd.read_csv(labels, header=0)
+    """Get the manual stride border labels for a subject.
+
+    The label file is only parsed once per subject and the result is cached (see `clear_caches`).
+    """
+    return _get_manual_labels(subject_id, data_folder=data_folder).copy()
 
 
 def get_manual_labels_for_test(subject_id: str, test_name: str, data_folder=None) -> pd.DataFrame:
@@ -217,7 +347,7 @@ def get_manual_labels_for_test(subject_id: str, test_name: str, data_folder=None
     # Find the start and end index
     test_start = meta_data["imu_tests"][test_name]["start_idx"]
     test_stop = meta_data["imu_tests"][test_name]["stop_idx"]
-    labels = get_manual_labels(subject_id, data_folder=data_folder)
+    labels = _get_manual_labels(subject_id, data_folder=data_folder)
     labels = labels[(labels["start"] >= test_start) & (labels["end"] <= test_stop)].copy()
     labels[["start", "end"]] -= test_start
     return labels.reset_index(drop=True)
@@ -239,30 +369,77 @@ def get_mocap_test(subject: str, test_name: str, data_folder=None) -> pd.DataFra
         raise FileNotFoundError("No Mocap data exists for subject {} and test {}".format(subject, test_name)) from e
 
 
-def get_metadata_subject(subject_id: str, data_folder=None) -> Dict[str, Any]:
-    """Get the content of the meta data file."""
-    folder = get_data_folder(data_folder) / subject_id
-    return json.load((folder / "meta_data.json").open("r"))
+@lru_cache(maxsize=None)
+def _load_metadata(metadata_file: Path) -> Mapping[str, Any]:
+    with metadata_file.open("r") as f:
+        return _freeze(json.load(f))
+
+
+def _freeze(obj):
+    if isinstance(obj, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in obj.items()})
+    if isinstance(obj, list):
+        return tuple(_freeze(v) for v in obj)
+    return obj
+
+
+def _unfreeze(obj):
+    if isinstance(obj, Mapping):
+        return {k: _unfreeze(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_unfreeze(v) for v in obj]
+    return obj
 
 
-def update_metadata_subject(subject_id: str, new_metadata: Dict[str, Any], data_folder=None):
-    """Update the metadata for a subject."""
+def get_metadata_subject(subject_id: str, data_folder=None) -> Mapping[str, Any]:
+    """Get the content of the meta data file.
+
+    The file is only parsed once per subject and the result is cached.
+    As the result is shared between calls, it is returned as a read-only mapping (nested lists are returned as
+    tuples).
+    If you need to modify the metadata, create a `dict` of the parts you want to change.
+    `update_metadata_subject` accepts the read-only parts as well.
+    """
+    folder = _get_resolved_data_folder(data_folder) / subject_id
+    return _load_metadata(folder / "meta_data.json")
+
+
+def update_metadata_subject(subject_id: str, new_metadata: Mapping[str, Any], data_folder=None):
+    """Update the metadata for a subject.
+
+    `new_metadata` can be a dict or (parts of) the read-only mapping returned by `get_metadata_subject`.
+    """
     folder = get_data_folder(data_folder) / subject_id
-    json.dump(new_metadata, (folder / "meta_data.json").open("w"), indent=4, sort_keys=True)
+    with (folder / "meta_data.json").open("w") as f:
+        json.dump(_unfreeze(new_metadata), f, indent=4, sort_keys=True)
+    clear_caches()
+
+
+@lru_cache(maxsize=None)
+def _index_sensor_files(imu_folder: Path) -> Dict[str, str]:
+    # Sensor files are named "NilsPodX-{SENSOR_ID}_{date}_{time}.bin"
+    index = {}
+    for f in imu_folder.glob("*.bin"):
+        index.setdefault(f.name.split("-")[1].split("_")[0], f.name)
+    return index
 
 
 def get_sensor_file(subject_id: str, sensor_name: str, data_folder=None) -> Path:
     """Get the path to the sensor file based on the simple position name.
 
     The sensor name should be of form {l/r}_{positon}
+
+    The content of the imu folder is only scanned once per subject and cached for the lifetime of the process (see
+    `clear_caches`).
     """
-    folder = get_data_folder(data_folder) / subject_id
-    meta_data = json.load((folder / "meta_data.json").open("r"))
-    sensor_id = meta_data["sensors"][sensor_name]
-    imu = folder / "imu"
-    for f in imu.glob("*.bin"):
-        if f.name.split("-")[1].startswith(sensor_id.upper()):
-            return f
+    sensor_id = get_metadata_subject(subject_id, data_folder=data_folder)["sensors"][sensor_name]
+    resolved_imu_folder = get_subject_imu_folder(
+        subject_id, data_folder=_get_resolved_data_folder(data_folder, data_subfolder=False)
+    )
+    file_name = _index_sensor_files(resolved_imu_folder).get(sensor_id.upper())
+    if file_name is None:
+        return None
+    return get_subject_imu_folder(subject_id, data_folder=data_folder) / file_name
 
 
 def load_c3d_data(path: Union[Path, str], insert_nan: bool = True) -> pd.DataFrame:
@@ -278,22 +455,21 @@ def load_c3d_data(path: Union[Path, str], insert_nan: bool = True) -> pd.DataFra
     """
     with open(path, "rb") as handle:
         reader = c3d.Reader(handle)
-        frames = []
-
-        for i, points, analog in reader.read_frames():
-            frames.append(points[:, :3])
+        # We fill a preallocated buffer instead of stacking a list of all frames at the end
+        frames = np.empty((reader.last_frame() - reader.first_frame() + 1, reader.point_used, 3))
+        for i, (_, points, _) in enumerate(reader.read_frames()):
+            frames[i] = points[:, :3]
 
         a = reader.groups["POINT"].params["LABELS"]
         C, R = a.dimensions
-        labels = [a.bytes[r * C : (r + 1) * C].strip().decode().lower() for r in range(R)]
+        labels = [label.strip().decode().lower() for label in np.frombuffer(a.bytes, dtype="S{}".format(C), count=R)]
 
-        frames = np.stack(frames)
         frames = frames.reshape(frames.shape[0], -1)
-    index = pd.MultiIndex.from_product([labels, list("xyz")])
-    data = pd.DataFrame(frames, columns=index)
     if insert_nan is True:
-        data[data == 0.000000] = np.nan
-    return data
+        # Masking the raw array avoids creating a boolean dataframe of the same size
+        frames[frames == 0.000000] = np.nan
+    index = pd.MultiIndex.from_product([labels, list("xyz")])
+    return pd.DataFrame(frames, columns=index)
 
 
 def get_foot_sensor(foot: Literal["left", "right"], include_insole: bool = True) -> List[str]:
@@ -312,16 +488,12 @@ def get_foot_marker(foot: Literal["left", "right"]) -> List[str]:
 
 def align_coordinates(multi_sensor_data: pd.DataFrame):
     """Helper to rotate all coordinate systems into the expected foot-sensor-frame."""
-    feet = {"r": "right", "l": "left"}
-    rotations = {}
-    for s in multi_sensor_data.columns.unique(level=0):
-        if "_" not in s:
-            continue
-        foot, pos = s.split("_")
-        rot = COORDINATE_TRANSFORMATION_DICT.get("qualisis_{}_nilspodv1".format(pos), None)
-        if not rot:
-            continue
-        rotations[s] = Rotation.from_matrix(rot["{}_sensor".format(feet[foot])])
-    ds = rotate_dataset(multi_sensor_data.drop(columns="sync"), rotations)
-    ds["sync"] = multi_sensor_data["sync"]
-    return ds
+    rotations = {
+        s: _ALIGNMENT_ROTATIONS[s] for s in multi_sensor_data.columns.unique(level=0) if s in _ALIGNMENT_ROTATIONS
+    }
+    # All columns without a rotation (including "sync") are passed through unmodified
+    aligned = rotate_dataset(multi_sensor_data, rotations)
+    # Previous versions re-added the sync data as a single column labeled ("sync", "").
+    # We keep this label for backwards compatibility.
+    aligned.columns = pd.MultiIndex.from_tuples([("sync", "") if c[0] == "sync" else c for c in aligned.columns])
+    return aligned
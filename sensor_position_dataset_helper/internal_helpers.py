@@ -7,10 +7,15 @@ All original authors agreed to have the respective code snippets published in th
 
 In case any problems are detected, these changes should be upstreamed to the respective internal libraries.
 """
-from typing import Dict, Union, Optional, Tuple
+import os
+import warnings
+from pathlib import Path
+from typing import Dict, Union, Tuple, Optional, Callable, List
 
 import numpy as np
 import pandas as pd
+from joblib import Memory, hash as joblib_hash
+from joblib.func_inspect import get_func_code
 from numpy.linalg import norm
 from scipy.spatial.transform import Rotation
 
@@ -114,20 +119,40 @@ def rotation_from_angle(axis: np.ndarray, angle: Union[float, np.ndarray]) -> Ro
     return Rotation.from_rotvec(np.squeeze(axis * angle.T))
 
 
-def _rotate_sensor(data: pd.DataFrame, rotation: Optional[Rotation], inplace: bool = False) -> pd.DataFrame:
-    """Rotate the data of a single sensor with acc and gyro."""
-    if inplace is False:
-        data = data.copy()
-    if rotation is None:
-        return data
-    data[SF_GYR] = rotation.apply(data[SF_GYR].to_numpy())
-    data[SF_ACC] = rotation.apply(data[SF_ACC].to_numpy())
-    return data
+def _rotate_sensors_inplace(rotations: List[Rotation], data: np.ndarray, positions: np.ndarray):
+    """Rotate the gyr and acc columns of multiple sensors of an array in place.
+
+    Parameters
+    ----------
+    rotations : list of Rotation objects with length n_sensors
+        single rotation or rotation per sample for each sensor
+    data : array with shape (n_samples, n_columns)
+        data array that is modified in place
+    positions : array with shape (n_sensors * 6,)
+        column index of the x, y, z column of the gyr and the acc block of each sensor
+
+    """
+    for rotation, sensor_positions in zip(rotations, positions.reshape(-1, 6)):
+        # Only the matrices of a single sensor exist at a time to limit the memory usage of rotations per sample.
+        # The matrices use the dtype of the data to avoid an upcast of the data.
+        matrix = rotation.as_matrix().astype(data.dtype, copy=False)
+        for block_positions in sensor_positions.reshape(2, 3):
+            start = block_positions[0]
+            # Adjacent columns can be accessed as a view, which avoids a temporary copy of the block.
+            block_index = slice(start, start + 3) if np.all(np.diff(block_positions) == 1) else block_positions
+            block = data[:, block_index]
+            if matrix.ndim == 2:
+                # x' = R @ x for all samples is equivalent to X @ R.T.
+                data[:, block_index] = block @ matrix.T
+            else:
+                data[:, block_index] = np.einsum("nij,nj->ni", matrix, block)
 
 
 def rotate_dataset(dataset: pd.DataFrame, rotation: Union[Rotation, Dict[str, Rotation]]) -> pd.DataFrame:
     """Apply a rotation to acc and gyro data of a dataset.
 
+    The gyr and acc data of all rotated sensors is rotated directly in a single copy of the data.
+
     Parameters
     ----------
     dataset
@@ -147,16 +172,32 @@ def rotate_dataset(dataset: pd.DataFrame, rotation: Union[Rotation, Dict[str, Ro
     if not isinstance(rotation_dict, dict):
         rotation_dict = {k: rotation for k in dataset.columns.unique(level=0)}
 
-    rotated_dataset = dataset.copy()
-    original_cols = dataset.columns
-
-    for key in rotation_dict.keys():
-        test = _rotate_sensor(dataset[key], rotation_dict[key], inplace=False)
-        rotated_dataset[key] = test
-
-    # Restore original order
-    rotated_dataset = rotated_dataset[original_cols]
-    return rotated_dataset
+    sensors = [k for k, v in rotation_dict.items() if v is not None]
+    if not sensors:
+        return dataset.copy()
+    cols = pd.MultiIndex.from_tuples([(s, c) for s in sensors for c in [*SF_GYR, *SF_ACC]])
+    rotations = [rotation_dict[s] for s in sensors]
+
+    positions = dataset.columns.get_indexer(cols)
+    if (positions < 0).any():
+        raise KeyError("The dataset has no gyr and acc columns for: {}".format(list(cols[positions < 0])))
+    dtype = np.result_type(*dataset.dtypes.iloc[positions].unique())
+    if not np.issubdtype(dtype, np.floating):
+        # Rotated integer data can not be represented in its original dtype
+        dtype = np.result_type(dtype, np.float64)
+
+    if dataset.dtypes.nunique() == 1 and dataset.dtypes.iloc[0] == dtype:
+        # All columns can be represented by a single array.
+        # We work on one copy of this array and wrap the result into a new dataframe without copying it again.
+        values = dataset.to_numpy(copy=True)
+        _rotate_sensors_inplace(rotations, values, positions)
+        return pd.DataFrame(values, index=dataset.index, columns=dataset.columns, copy=False)
+    rotated = dataset.iloc[:, positions].to_numpy(dtype=dtype, copy=True)
+    _rotate_sensors_inplace(rotations, rotated, np.arange(len(cols)))
+    rotated = pd.DataFrame(rotated, index=dataset.index, columns=cols)
+    # Assigning many columns via `.loc` is extremely slow for MultiIndex columns.
+    # Concatenating with the unmodified columns and restoring the original order is much faster.
+    return pd.concat([dataset.drop(columns=cols), rotated], axis=1).reindex(columns=dataset.columns)
 
 
 def sliding_window_view(arr: np.ndarray, window_length: int, overlap: int, nan_padding: bool = False) -> np.ndarray:
@@ -314,3 +355,46 @@ def normalize(v: np.ndarray) -> np.ndarray:
     # We do not want a warning when we divide by 0 as we expect it
     with np.errstate(divide="ignore", invalid="ignore"):
         return (v.T / norm(v, axis=ax)).T
+
+
+def _cached_df_call(memory: Optional[Memory], func: Callable[..., pd.DataFrame], *args, **kwargs) -> pd.DataFrame:
+    """Call `func` and cache the returned dataframe in the storage location of the joblib memory.
+
+    joblib serializes return values with its generic numpy pickler, which is considerably slower than the native pickle
+    format of pandas for the large session dataframes.
+    Hence, we only use the memory object to get the cache location and store the results using `pd.to_pickle`.
+    Like in joblib, the cache is keyed on the source code of the function and all arguments and `memory.clear()`
+    removes it.
+    As the cached functions are usually thin wrappers around other functions of this package, the package version is
+    part of the key as well.
+    The pandas version is included, as pickle files are not guaranteed to be readable by other pandas versions.
+    If a cache file can not be read anyway (e.g. because it is truncated), a warning is raised and the result is
+    recomputed and stored again.
+    The files are bucketed into subfolders based on the first characters of the hash to keep the individual
+    directories small.
+    If the memory has no location, no caching is performed.
+    """
+    if memory is None or memory.location is None:
+        return func(*args, **kwargs)
+    # Imported here to avoid a circular import
+    from sensor_position_dataset_helper import __version__
+
+    call_hash = joblib_hash((get_func_code(func)[0], __version__, pd.__version__, args, sorted(kwargs.items())))
+    path = Path(
+        memory.store_backend.location, func.__module__, func.__name__, call_hash[:2], "{}.pkl".format(call_hash)
+    )
+    if path.is_file():
+        try:
+            return pd.read_pickle(path)
+        except Exception as e:
+            warnings.warn(
+                "Exception while loading the cached result from {}. The result is recomputed.\n{!r}".format(path, e),
+                stacklevel=2,
+            )
+    df = func(*args, **kwargs)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file first, so that no other process can read a partially written file.
+    tmp_path = path.with_name("{}.{}".format(path.name, os.getpid()))
+    df.to_pickle(tmp_path)
+    tmp_path.replace(path)
+    return df
@@ -18,9 +18,10 @@ import warnings
 from pathlib import Path
 from typing import Optional, List, Union, Dict
 
+import numpy as np
 import pandas as pd
 from imucal.management import CalibrationWarning
-from joblib import Memory
+from joblib import Memory, Parallel, delayed
 from nilspodlib.exceptions import LegacyWarning, CorruptedPackageWarning, SynchronisationWarning
 from tpcp import Dataset
 
@@ -36,17 +37,35 @@ from sensor_position_dataset_helper import (
     get_foot_sensor,
     align_coordinates,
 )
+from sensor_position_dataset_helper.helper import _get_dataset_cache_key
+from sensor_position_dataset_helper.internal_helpers import _cached_df_call
 
 
-def get_memory(mem):
-    if not mem:
-        return Memory()
-    return mem
+def _load_session_df(participant, data_folder, align_data, dataset_revision=None):
+    # `dataset_revision` is not used, but only part of the cache key
+    with warnings.catch_warnings():
+        warnings.simplefilter(
+            "ignore", (LegacyWarning, CorruptedPackageWarning, CalibrationWarning, SynchronisationWarning)
+        )
+        session_df = get_session_df(participant, data_folder=data_folder)
+        if align_data is True:
+            return align_coordinates(session_df)
+        return session_df
+
+
+def _load_mocap_events(participant, test, data_folder, dataset_revision=None):
+    # `dataset_revision` is not used, but only part of the cache key
+    return get_mocap_events(participant, test, data_folder=data_folder)
+
 
+def _load_mocap_test(participant, test, data_folder, dataset_revision=None):
+    # `dataset_revision` is not used, but only part of the cache key
+    return get_mocap_test(participant, test, data_folder=data_folder)
 
-def _get_session_and_align(participant, data_folder):
-    session_df = get_session_df(participant, data_folder=data_folder)
-    return align_coordinates(session_df)
+
+def _prefetch_session_df(memory, participant, align_data, dataset_key):
+    # We don't return the dataframe to avoid sending it back to the main process
+    _cached_df_call(memory, _load_session_df, participant, align_data=align_data, **dataset_key)
 
 
 class _SensorPostionDataset(Dataset):
@@ -88,21 +107,42 @@ class _SensorPostionDataset(Dataset):
     def _get_segmented_stride_list(self, index) -> pd.DataFrame:
         raise NotImplementedError()
 
+    def _cached_call(self, func, *args, **kwargs):
+        # The cache key requires the git revision of the dataset.
+        # Hence, we only create it, if the result is actually cached.
+        if self.memory is None or self.memory.location is None:
+            return func(*args, data_folder=self.data_folder, **kwargs)
+        return _cached_df_call(self.memory, func, *args, **kwargs, **_get_dataset_cache_key(self.data_folder))
+
     def _get_base_df(self):
         self.assert_is_single(None, "data")
-        with warnings.catch_warnings():
-            warnings.simplefilter(
-                "ignore", (LegacyWarning, CorruptedPackageWarning, CalibrationWarning, SynchronisationWarning)
-            )
-            if self.align_data is True:
-                session_df = get_memory(self.memory).cache(_get_session_and_align)(
-                    self.index["participant"].iloc[0], data_folder=self.data_folder
-                )
-            else:
-                session_df = get_memory(self.memory).cache(get_session_df)(
-                    self.index["participant"].iloc[0], data_folder=self.data_folder
-                )
-        return session_df
+        # The dataframe is only created within the cached function, so the cache is keyed only on the
+        # participant and the loading parameters and never needs to hash the large session dataframe.
+        return self._cached_call(_load_session_df, self.index["participant"].iloc[0], align_data=self.align_data)
+
+    def prefetch(self, n_jobs: int = -1):
+        """Load the IMU data of all participants in the dataset in parallel and store it in the cache.
+
+        Afterwards, accessing `.data` only needs to read the cached data.
+        This requires a `memory` with a cache location.
+        Note that each worker needs to hold the full session data of one participant in RAM.
+        Reduce `n_jobs` if you run out of memory.
+
+        Parameters
+        ----------
+        n_jobs
+            The number of parallel jobs passed to `joblib.Parallel`.
+
+        """
+        if self.memory is None or self.memory.location is None:
+            raise ValueError("Prefetching requires a `memory` object with a cache location.")
+        # The key is created in the main process, as the workers don't know the folder set by `set_data_folder`
+        dataset_key = _get_dataset_cache_key(self.data_folder)
+        Parallel(n_jobs=n_jobs)(
+            delayed(_prefetch_session_df)(self.memory, p, self.align_data, dataset_key)
+            for p in self.index["participant"].unique()
+        )
+        return self
 
     @property
     def segmented_stride_list_per_sensor_(self) -> Dict[str, pd.DataFrame]:
@@ -112,13 +152,12 @@ class _SensorPostionDataset(Dataset):
         stridelist (either left or right foot) as value.
         This can be helpful, if you want to iterate over all sensors and get the correct stride list.
         """
-        stride_list = self.segmented_stride_list_
-        final_stride_list = {}
-        for foot in ["left", "right"]:
-            foot_stride_list = stride_list[foot][["start", "end"]]
-            for s in get_foot_sensor(foot):
-                final_stride_list[s] = foot_stride_list
-        return final_stride_list
+        self.assert_is_single(None, "segmented_stride_list_per_sensor_")
+        stride_list = self._get_segmented_stride_list(self.index)
+        stride_list.index = stride_list.index.astype(int)
+        # All sensors of one foot share the same stride list object
+        foot_stride_list = {k: v[["start", "end"]] for k, v in stride_list.groupby("foot", sort=False)}
+        return {s: foot_stride_list[foot] for foot in ["left", "right"] for s in get_foot_sensor(foot)}
 
 
 class SensorPositionDatasetSegmentation(_SensorPostionDataset):
@@ -150,8 +189,8 @@ class SensorPositionDatasetSegmentation(_SensorPostionDataset):
     @property
     def data(self) -> pd.DataFrame:
         df = self._get_base_df()
-        df = df.reset_index(drop=True)
-        df.index /= self.sampling_rate_hz
+        # Directly creating the float index avoids the copy of the data by `reset_index`
+        df.index = pd.Index(np.arange(len(df)) / self.sampling_rate_hz)
         return df
 
     def _get_segmented_stride_list(self, index) -> pd.DataFrame:
@@ -241,10 +280,9 @@ class SensorPositionDatasetMocap(_SensorPostionDataset):
             data_folder=self.data_folder,
             padding_s=self.data_padding_s,
         )
-        df = df.reset_index(drop=True)
-        df.index /= self.sampling_rate_hz
-        df.index -= self.data_padding_s
-        df.index.name = "time after start [s]"
+        df.index = pd.Index(
+            np.arange(len(df)) / self.sampling_rate_hz - self.data_padding_s, name="time after start [s]"
+        )
 
         return df
 
@@ -269,8 +307,8 @@ class SensorPositionDatasetMocap(_SensorPostionDataset):
         `self.data_padding_s` is also ignored.
         """
         self.assert_is_single(None, "mocap_events_")
-        mocap_events = get_mocap_events(
-            self.index["participant"].iloc[0], self.index["test"].iloc[0], data_folder=self.data_folder
+        mocap_events = self._cached_call(
+            _load_mocap_events, self.index["participant"].iloc[0], self.index["test"].iloc[0]
         )
         mocap_events = {k: v.drop("foot", axis=1) for k, v in mocap_events.groupby("foot")}
         return mocap_events
@@ -287,18 +325,15 @@ class SensorPositionDatasetMocap(_SensorPostionDataset):
         Note the index is provided in seconds after the start of the test and `self.data_padding_s` is ignored!
         """
         self.assert_is_single(None, "marker_position_")
-        df = get_memory(self.memory).cache(get_mocap_test)(
-            self.index["participant"].iloc[0], self.index["test"].iloc[0], data_folder=self.data_folder
-        )
+        df = self._cached_call(_load_mocap_test, self.index["participant"].iloc[0], self.index["test"].iloc[0])
         df = df.reset_index(drop=True)
         df.index /= self.mocap_sampling_rate_hz_
         df.index.name = "time after start [s]"
         return df
 
     def create_index(self) -> pd.DataFrame:
-        tests = (
-            (p, t)
-            for p in get_all_subjects(self.include_wrong_recording, data_folder=self.data_folder)
-            for t in get_all_tests(p, self.data_folder)
+        participants = list(get_all_subjects(self.include_wrong_recording, data_folder=self.data_folder))
+        tests = [list(get_all_tests(p, self.data_folder)) for p in participants]
+        return pd.DataFrame(
+            {"participant": np.repeat(participants, [len(t) for t in tests]), "test": np.concatenate(tests)}
         )
-        return pd.DataFrame(tests, columns=["participant", "test"])
@@ -0,0 +1,234 @@
+from pathlib import Path
+
+import git
+import numpy as np
+import pandas as pd
+import pytest
+from joblib import Memory
+from pandas._testing import assert_frame_equal, assert_series_equal
+from scipy.spatial.transform import Rotation
+
+import sensor_position_dataset_helper
+from sensor_position_dataset_helper import align_coordinates, helper, set_data_folder
+from sensor_position_dataset_helper.consts import Consts
+from sensor_position_dataset_helper.internal_helpers import rotate_dataset, rotation_from_angle
+
+
+@pytest.fixture
+def session_df_calls(monkeypatch):
+    # Replace the actual data loading, so that the caching can be tested without the dataset
+    calls = []
+
+    def _get_session_df(subject_id, data_folder=None, dataset_revision=None):
+        calls.append((subject_id, data_folder, dataset_revision))
+        return pd.DataFrame({"acc_x": [1.0, 2.0, 3.0]})
+
+    monkeypatch.setattr(helper, "_get_session_df", _get_session_df)
+    return calls
+
+
+def _commit(repo):
+    actor = git.Actor("test", "test@example.com")
+    repo.index.commit("update", author=actor, committer=actor)
+
+
+def test_session_df_cache_hit(tmp_path, session_df_calls):
+    memory = Memory(tmp_path / "cache", verbose=0)
+    first = helper.get_session_df("4d91", data_folder=tmp_path, memory=memory)
+    second = helper.get_session_df("4d91", data_folder=tmp_path, memory=memory)
+
+    assert len(session_df_calls) == 1
+    assert session_df_calls[0] == ("4d91", str(tmp_path), None)
+    assert_frame_equal(first, second)
+
+    helper.get_session_df("e54d", data_folder=tmp_path, memory=memory)
+    assert len(session_df_calls) == 2
+
+
+@pytest.mark.parametrize("memory", (None, Memory(None, verbose=0)))
+def test_session_df_cache_without_memory(tmp_path, session_df_calls, monkeypatch, memory):
+    # Without caching, the dataset revision is not required
+    monkeypatch.setattr(helper, "_get_dataset_revision", pytest.fail)
+    helper.get_session_df("4d91", data_folder=tmp_path, memory=memory)
+    helper.get_session_df("4d91", data_folder=tmp_path, memory=memory)
+    assert len(session_df_calls) == 2
+
+
+def test_session_df_cache_dataset_revision(tmp_path, session_df_calls):
+    data_folder = tmp_path / "dataset"
+    repo = git.Repo.init(data_folder)
+    _commit(repo)
+    memory = Memory(tmp_path / "cache", verbose=0)
+
+    helper.get_session_df("4d91", data_folder=data_folder, memory=memory)
+    helper.get_session_df("4d91", data_folder=data_folder, memory=memory)
+    assert len(session_df_calls) == 1
+    assert session_df_calls[0][2] == repo.head.commit.hexsha
+
+    # A different revision of the dataset must not use the old cache
+    _commit(repo)
+    helper.get_session_df("4d91", data_folder=data_folder, memory=memory)
+    assert len(session_df_calls) == 2
+    assert session_df_calls[1][2] == repo.head.commit.hexsha
+
+
+def test_dataset_revision_without_commits(tmp_path):
+    git.Repo.init(tmp_path)
+    assert helper._get_dataset_revision(tmp_path) is None
+
+
+def test_dataset_revision_without_git(tmp_path, monkeypatch):
+    _commit(git.Repo.init(tmp_path))
+    monkeypatch.setattr(git.Git, "GIT_PYTHON_GIT_EXECUTABLE", str(tmp_path / "no_git"))
+    assert helper._get_dataset_revision(tmp_path) is None
+
+
+def test_dataset_cache_key_global_data_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(Consts, "_DATA", None)
+    set_data_folder(tmp_path)
+    assert helper._get_dataset_cache_key() == helper._get_dataset_cache_key(str(tmp_path))
+    assert helper._get_dataset_cache_key() == {"data_folder": str(tmp_path.resolve()), "dataset_revision": None}
+
+
+def test_rotate_sensor_180_z():
+    columns = pd.MultiIndex.from_product([["l_medial", "back"], ["acc_x", "acc_y", "acc_z", "gyr_x", "gyr_y", "gyr_z"]])
+    df = pd.DataFrame(np.arange(24.0).reshape(2, 12), columns=columns)
+    expected = rotate_dataset(df, {"l_medial": Rotation.from_euler("z", 180, degrees=True)})
+
+    out = helper._rotate_sensor_180_z(df.copy(), "l_medial")
+    assert_frame_equal(out, expected, check_exact=False, atol=1e-12)
+
+
+def test_rotate_sensor_180_z_missing_sensor():
+    columns = pd.MultiIndex.from_product([["back"], ["acc_x", "acc_y", "acc_z", "gyr_x", "gyr_y", "gyr_z"]])
+    df = pd.DataFrame(np.ones((2, 6)), columns=columns)
+    with pytest.raises(KeyError):
+        helper._rotate_sensor_180_z(df, "l_medial")
+    # The dataframe must not be modified
+    assert (df == 1).all().all()
+
+
+def test_align_coordinates_sync_label():
+    columns = pd.MultiIndex.from_product([["l_cavity", "back"], ["acc_x", "acc_y", "acc_z", "gyr_x", "gyr_y", "gyr_z"]])
+    df = pd.DataFrame(np.ones((3, 12)), columns=columns)
+    df[("sync", "trigger")] = np.arange(3.0)
+
+    aligned = align_coordinates(df)
+    assert list(aligned.columns) == [*df.columns[:-1], ("sync", "")]
+    assert_series_equal(aligned[("sync", "")], df[("sync", "trigger")], check_names=False)
+
+
+def _create_metadata(data_folder, subject_id, metadata):
+    (data_folder / "data" / subject_id).mkdir(parents=True)
+    helper.update_metadata_subject(subject_id, metadata, data_folder=data_folder)
+
+
+def test_metadata_is_read_only(tmp_path):
+    _create_metadata(tmp_path, "4d91", {"sensors": {"back": "e5f6"}, "tests": ["fast_10"]})
+    meta_data = helper.get_metadata_subject("4d91", data_folder=tmp_path)
+
+    with pytest.raises(TypeError):
+        meta_data["sensors"]["back"] = "ffff"
+    with pytest.raises(TypeError):
+        meta_data["new"] = 1
+    assert meta_data["tests"] == ("fast_10",)
+    assert helper.get_metadata_subject("4d91", data_folder=tmp_path)["sensors"]["back"] == "e5f6"
+
+
+def test_update_metadata_accepts_read_only_metadata(tmp_path):
+    _create_metadata(tmp_path, "4d91", {"sensors": {"back": "e5f6"}, "tests": ["fast_10"]})
+    meta_data = helper.get_metadata_subject("4d91", data_folder=tmp_path)
+
+    helper.update_metadata_subject("4d91", {**meta_data, "sensors": {"back": "ffff"}}, data_folder=tmp_path)
+    new_meta_data = helper.get_metadata_subject("4d91", data_folder=tmp_path)
+    assert new_meta_data["sensors"]["back"] == "ffff"
+    assert new_meta_data["tests"] == ("fast_10",)
+
+    # Writing the unmodified metadata back does not change it
+    helper.update_metadata_subject("4d91", new_meta_data, data_folder=tmp_path)
+    assert helper._unfreeze(helper.get_metadata_subject("4d91", data_folder=tmp_path)) == {
+        "sensors": {"back": "ffff"},
+        "tests": ["fast_10"],
+    }
+
+
+def test_get_all_subjects_invalid_folder_is_not_cached(tmp_path):
+    (tmp_path / "data").mkdir()
+    with pytest.raises(ValueError):
+        list(helper.get_all_subjects(data_folder=tmp_path))
+
+    for subject in ("e54d", "4d91", "6dbe"):
+        (tmp_path / "data" / subject).mkdir()
+    assert list(helper.get_all_subjects(data_folder=tmp_path)) == ["4d91", "e54d"]
+    assert list(helper.get_all_subjects(True, data_folder=tmp_path)) == ["4d91", "6dbe", "e54d"]
+
+
+def test_relative_data_folder_follows_cwd(tmp_path, monkeypatch):
+    for tree in ("A", "B"):
+        data_folder = tmp_path / tree / "ds"
+        (data_folder / "data" / (tree.lower() * 4)).mkdir(parents=True)
+        _create_metadata(data_folder, "4d91", {"mocap_test_start": {tree: 0}, "imu_tests": {}})
+
+    monkeypatch.chdir(tmp_path / "A")
+    assert list(helper.get_all_subjects(data_folder="ds")) == ["4d91", "aaaa"]
+    assert list(helper.get_all_tests("4d91", data_folder="ds")) == ["A"]
+    monkeypatch.chdir(tmp_path / "B")
+    assert list(helper.get_all_subjects(data_folder="ds")) == ["4d91", "bbbb"]
+    assert list(helper.get_all_tests("4d91", data_folder="ds")) == ["B"]
+
+
+def test_clear_caches(tmp_path):
+    _create_metadata(tmp_path, "4d91", {"mocap_test_start": {"fast_10": 0}, "imu_tests": {}})
+    assert list(helper.get_all_tests("4d91", data_folder=tmp_path)) == ["fast_10"]
+
+    # Changes to the files (e.g. by checking out a different revision) are only picked up after clearing the caches
+    (tmp_path / "data" / "4d91" / "meta_data.json").write_text('{"mocap_test_start": {"slow_10": 0}}')
+    assert list(helper.get_all_tests("4d91", data_folder=tmp_path)) == ["fast_10"]
+    helper.clear_caches()
+    assert list(helper.get_all_tests("4d91", data_folder=tmp_path)) == ["slow_10"]
+
+
+def test_metadata_relative_data_folder_follows_cwd(tmp_path, monkeypatch):
+    for tree in ("A", "B"):
+        _create_metadata(tmp_path / tree / "ds", "4d91", {"sensors": {"back": tree}})
+
+    monkeypatch.chdir(tmp_path / "A")
+    assert helper.get_metadata_subject("4d91", data_folder="ds")["sensors"]["back"] == "A"
+    monkeypatch.chdir(tmp_path / "B")
+    assert helper.get_metadata_subject("4d91", data_folder="ds")["sensors"]["back"] == "B"
+
+
+def test_sensor_file_relative_data_folder_follows_cwd(tmp_path, monkeypatch):
+    for tree, date in (("A", "20190101"), ("B", "20200101")):
+        data_folder = tmp_path / tree / "ds"
+        _create_metadata(data_folder, "4d91", {"sensors": {"back": "e5f6", "l_cavity": "a1b2"}})
+        (data_folder / "data" / "4d91" / "imu").mkdir()
+        (data_folder / "data" / "4d91" / "imu" / "NilsPodX-E5F6_{}_120000.bin".format(date)).touch()
+
+    monkeypatch.chdir(tmp_path / "A")
+    assert helper.get_sensor_file("4d91", "back", data_folder="ds") == Path(
+        "ds/data/4d91/imu/NilsPodX-E5F6_20190101_120000.bin"
+    )
+    monkeypatch.chdir(tmp_path / "B")
+    assert helper.get_sensor_file("4d91", "back", data_folder="ds") == Path(
+        "ds/data/4d91/imu/NilsPodX-E5F6_20200101_120000.bin"
+    )
+    assert helper.get_sensor_file("4d91", "l_cavity", data_folder="ds") is None
+
+
+def test_manual_labels_relative_data_folder_follows_cwd(tmp_path, monkeypatch):
+    for tree, start in (("A", 0), ("B", 10)):
+        subject_folder = tmp_path / tree / "ds" / "data" / "4d91"
+        subject_folder.mkdir(parents=True)
+        pd.DataFrame({"s_id": [0], "start": [start], "end": [start + 5], "foot": ["left"]}).to_csv(
+            subject_folder / "manual_stride_border.csv", index=False
+        )
+
+    monkeypatch.chdir(tmp_path / "A")
+    assert helper.get_manual_labels("4d91", data_folder="ds")["start"].tolist() == [0]
+    monkeypatch.chdir(tmp_path / "B")
+    assert helper.get_manual_labels("4d91", data_folder="ds")["start"].tolist() == [10]
+
+
+def test_rotation_from_angle_is_public():
+    assert sensor_position_dataset_helper.rotation_from_angle is rotation_from_angle
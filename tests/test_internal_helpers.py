@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+import pytest
+from joblib import Memory
+from pandas._testing import assert_frame_equal
+from scipy.spatial.transform import Rotation
+
+from sensor_position_dataset_helper.internal_helpers import SF_ACC, SF_GYR, _cached_df_call, rotate_dataset
+
+SENSORS = ["back", "l_cavity", "r_heel"]
+
+
+def _create_dataset(n_samples=100, dtype="float64"):
+    rng = np.random.default_rng(0)
+    columns = pd.MultiIndex.from_product([SENSORS, [*SF_ACC, *SF_GYR]])
+    data = rng.normal(size=(n_samples, len(columns))) * 100
+    return pd.DataFrame(data, columns=columns).astype(dtype)
+
+
+def _expected_rotation(dataset, rotations):
+    expected = dataset.copy()
+    for sensor, rotation in rotations.items():
+        for cols in (SF_GYR, SF_ACC):
+            rotated = rotation.apply(dataset[sensor][cols].to_numpy(dtype=float))
+            for col, values in zip(cols, rotated.T):
+                expected[(sensor, col)] = values
+    return expected
+
+
+@pytest.mark.parametrize(
+    "rotations",
+    (
+        {"l_cavity": Rotation.from_rotvec([0.1, 0.2, 0.3])},
+        {"l_cavity": Rotation.from_rotvec([0.1, 0.2, 0.3]), "back": Rotation.from_euler("z", 90, degrees=True)},
+        {s: Rotation.from_rotvec([0.3, -0.2, 0.1]) for s in SENSORS},
+    ),
+)
+def test_rotate_dataset_dict(rotations):
+    dataset = _create_dataset()
+    assert_frame_equal(rotate_dataset(dataset, rotations), _expected_rotation(dataset, rotations))
+
+
+def test_rotate_dataset_none_is_skipped():
+    dataset = _create_dataset()
+    rotation = Rotation.from_rotvec([0.1, 0.2, 0.3])
+    out = rotate_dataset(dataset, {"l_cavity": rotation, "back": None})
+    assert_frame_equal(out, _expected_rotation(dataset, {"l_cavity": rotation}))
+
+
+def test_rotate_dataset_single_rotation():
+    dataset = _create_dataset()
+    rotation = Rotation.from_rotvec([0.1, 0.2, 0.3])
+    out = rotate_dataset(dataset, rotation)
+    assert_frame_equal(out, _expected_rotation(dataset, {s: rotation for s in SENSORS}))
+
+
+def test_rotate_dataset_rotation_per_sample():
+    dataset = _create_dataset()
+    rotations = {
+        "l_cavity": Rotation.from_rotvec(np.random.default_rng(1).normal(size=(len(dataset), 3))),
+        "r_heel": Rotation.from_rotvec([0.1, 0.2, 0.3]),
+    }
+    assert_frame_equal(rotate_dataset(dataset, rotations), _expected_rotation(dataset, rotations))
+
+
+def test_rotate_dataset_mixed_dtypes():
+    dataset = _create_dataset()
+    dataset[("back", "counter")] = np.arange(len(dataset))
+    rotations = {"back": Rotation.from_rotvec([0.1, 0.2, 0.3])}
+    out = rotate_dataset(dataset, rotations)
+    assert_frame_equal(out, _expected_rotation(dataset, rotations))
+    assert out[("back", "counter")].dtype == np.int64
+
+
+@pytest.mark.parametrize("rotate_all", (True, False))
+def test_rotate_dataset_int_dtype(rotate_all):
+    dataset = _create_dataset(dtype="int64")
+    rotation = Rotation.from_rotvec([0.1, 0.2, 0.3])
+    rotations = {s: rotation for s in SENSORS} if rotate_all else {"back": rotation}
+    out = rotate_dataset(dataset, rotations)
+    # Rotated columns are converted to float, all other columns keep their dtype
+    assert_frame_equal(out, _expected_rotation(dataset, rotations))
+    assert (out["back"].dtypes == np.float64).all()
+    if not rotate_all:
+        assert (out["l_cavity"].dtypes == np.int64).all()
+
+
+def test_rotate_dataset_float32_is_preserved():
+    dataset = _create_dataset(dtype="float32")
+    rotation = Rotation.from_rotvec([0.1, 0.2, 0.3])
+    out = rotate_dataset(dataset, rotation)
+    assert (out.dtypes == np.float32).all()
+    expected = _expected_rotation(dataset, {s: rotation for s in SENSORS}).astype("float32")
+    assert_frame_equal(out, expected, rtol=1e-4)
+
+
+@pytest.mark.parametrize(
+    "rotation",
+    (
+        Rotation.from_rotvec([0.1, 0.2, 0.3]),
+        {"l_cavity": Rotation.from_rotvec(np.random.default_rng(1).normal(size=(100, 3)))},
+    ),
+)
+@pytest.mark.parametrize("mixed_dtypes", (True, False))
+def test_rotate_dataset_input_not_modified(rotation, mixed_dtypes):
+    dataset = _create_dataset()
+    if mixed_dtypes:
+        dataset[("back", "counter")] = np.arange(len(dataset))
+    original = dataset.copy()
+    out = rotate_dataset(dataset, rotation)
+    assert_frame_equal(dataset, original)
+    assert not np.shares_memory(out["l_cavity"].to_numpy(), dataset["l_cavity"].to_numpy())
+
+
+def test_rotate_dataset_missing_sensor():
+    with pytest.raises(KeyError):
+        rotate_dataset(_create_dataset(), {"r_ankle": Rotation.identity()})
+
+
+def _create_df(value):
+    return pd.DataFrame({"a": [value]})
+
+
+@pytest.mark.parametrize("content", (b"", b"not a pickle"))
+def test_cached_df_call_recomputes_unreadable_cache(tmp_path, content):
+    memory = Memory(tmp_path, verbose=0)
+    assert_frame_equal(_cached_df_call(memory, _create_df, 1), _create_df(1))
+    (cache_file,) = tmp_path.rglob("*.pkl")
+    cache_file.write_bytes(content)
+
+    with pytest.warns(UserWarning, match="recomputed"):
+        assert_frame_equal(_cached_df_call(memory, _create_df, 1), _create_df(1))
+    # The broken file is replaced
+    assert_frame_equal(pd.read_pickle(cache_file), _create_df(1))
@@ -1,7 +1,11 @@
+import numpy as np
+import pandas as pd
 import pytest
+from joblib import Memory
 from pandas._testing import assert_frame_equal
 
-from sensor_position_dataset_helper import get_metadata_subject
+from sensor_position_dataset_helper import get_metadata_subject, helper, set_data_folder, tpcp_dataset
+from sensor_position_dataset_helper.consts import Consts
 from sensor_position_dataset_helper.tpcp_dataset import SensorPositionDatasetMocap, SensorPositionDatasetSegmentation
 from .conftest import CACHE, load_or_store_snapshot
 
@@ -53,6 +57,14 @@ def test_test_padding(dataset_path, padding):
     assert expected_length - 1 <= len(ds.data) <= expected_length + 1
 
 
+@pytest.mark.parametrize("base_class", (SensorPositionDatasetSegmentation, SensorPositionDatasetMocap))
+@pytest.mark.parametrize("align_data", (True, False))
+def test_sync_label(dataset_path, base_class, align_data):
+    ds = base_class(data_folder=dataset_path, align_data=align_data, memory=CACHE)[0]
+    # The aligned data keeps the label of previous versions
+    assert [c for c in ds.data.columns if c[0] == "sync"] == [("sync", "" if align_data else "trigger")]
+
+
 @pytest.mark.parametrize("base_class", (SensorPositionDatasetSegmentation, SensorPositionDatasetMocap))
 def test_data_regression(dataset_path, base_class):
     ds = base_class(data_folder=dataset_path, memory=CACHE)
@@ -64,3 +76,81 @@ def test_data_regression(dataset_path, base_class):
         compare = load_or_store_snapshot("test_data_regression_{}_{}".format(base_class.__name__, name), data[name])
 
         assert_frame_equal(data[name], compare)
+
+
+def test_prefetch_with_global_data_folder(dataset_path, tmp_path, monkeypatch):
+    # The parallel workers do not know about the globally registered data folder
+    monkeypatch.setattr(Consts, "_DATA", None)
+    set_data_folder(dataset_path)
+    ds = SensorPositionDatasetSegmentation(memory=Memory(tmp_path, verbose=0))
+    ds = ds.get_subset(participant=list(ds.index["participant"].iloc[:2]))
+
+    ds.prefetch(n_jobs=2)
+    cached_files = sorted(tmp_path.rglob("*.pkl"))
+    assert len(cached_files) == 2
+
+    # Accessing the data afterwards must use the prefetched entries and not create new ones
+    for subset in ds:
+        subset.data
+    assert sorted(tmp_path.rglob("*.pkl")) == cached_files
+
+
+@pytest.fixture
+def session_df_calls(monkeypatch):
+    # Replace the actual data loading, so that the caching can be tested without the dataset
+    calls = []
+
+    def _load_session_df(participant, data_folder, align_data, dataset_revision=None):
+        calls.append((participant, data_folder, dataset_revision))
+        return pd.DataFrame({"acc_x": np.arange(3.0)})
+
+    monkeypatch.setattr(tpcp_dataset, "_load_session_df", _load_session_df)
+    return calls
+
+
+@pytest.mark.parametrize("memory", (None, Memory(None, verbose=0)))
+def test_data_without_cache_does_not_use_git(tmp_path, session_df_calls, monkeypatch, memory):
+    monkeypatch.setattr(helper, "_get_dataset_revision", pytest.fail)
+    ds = SensorPositionDatasetSegmentation(
+        data_folder=tmp_path, memory=memory, subset_index=pd.DataFrame({"participant": ["4d91"]})
+    )
+    ds.data
+    ds.data
+    assert session_df_calls == [("4d91", tmp_path, None), ("4d91", tmp_path, None)]
+
+
+def test_data_with_cache(tmp_path, session_df_calls):
+    ds = SensorPositionDatasetSegmentation(
+        data_folder=tmp_path,
+        memory=Memory(tmp_path / "cache", verbose=0),
+        subset_index=pd.DataFrame({"participant": ["4d91"]}),
+    )
+    ds.data
+    ds.data
+    assert session_df_calls == [("4d91", str(tmp_path.resolve()), None)]
+
+
+@pytest.mark.parametrize(
+    "property_name, loader_name",
+    (("mocap_events_", "get_mocap_events"), ("marker_position_", "get_mocap_test")),
+)
+def test_mocap_cache_follows_global_data_folder(tmp_path, monkeypatch, property_name, loader_name):
+    calls = []
+
+    def _loader(participant, test, data_folder=None):
+        calls.append(data_folder)
+        return pd.DataFrame({"foot": ["left", "right"], "value": [len(calls), len(calls)]})
+
+    monkeypatch.setattr(tpcp_dataset, loader_name, _loader)
+    monkeypatch.setattr(Consts, "_DATA", None)
+    ds = SensorPositionDatasetMocap(
+        memory=Memory(tmp_path / "cache", verbose=0),
+        subset_index=pd.DataFrame({"participant": ["4d91"], "test": ["fast_10"]}),
+    )
+    for folder in ("A", "B", "A"):
+        (tmp_path / folder).mkdir(exist_ok=True)
+        set_data_folder(tmp_path / folder)
+        getattr(ds, property_name)
+
+    # Each dataset folder has its own cache entry
+    assert calls == [str((tmp_path / "A").resolve()), str((tmp_path / "B").resolve())]